@@ -1,21 +1,32 @@
 from flask import Flask
 from flasgger import Swagger
 from mongo_db_connection_manager import MongoConnectionManager
-from controller.ad_entrypoints import ad_routes_blueprint
-from routes import init_routes
 import os
 
 
-app = Flask(__name__)
-Swagger(app)
+def create_app():
+    """
+    Create and configure the Flask application
 
-# Initalize Database Connection
-MongoConnectionManager.init_db()
+    :return: Flask application
+    :rtype: Flask
+    """
+    app = Flask(__name__)
+    Swagger(app)
 
-#Importe the routes
-init_routes(app)
+    # Initialize Database Connection
+    MongoConnectionManager.init_db()
+
+    # Import the routes after the database is up; the controller uses it at import time
+    from routes import init_routes
+    init_routes(app)
+
+    return app
+
+
+app = create_app()
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 1993))
-    app.run(debug=True, port=port)
\ No newline at end of file
+    app.run(debug=True, port=port)
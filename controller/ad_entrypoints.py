@@ -1,20 +1,39 @@
-from flask import request, jsonify, Blueprint
+from flask import request, Blueprint, Response, stream_with_context
 from mongo_db_connection_manager import MongoConnectionManager
-import random
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, ConnectionFailure, PyMongoError
+from collections import defaultdict
+from queue import Queue, Empty, Full
+import orjson
+import threading
+import atexit
+import os
+from cachetools import TTLCache
 from datetime import datetime, timezone
 from email_validator import validate_email, EmailNotValidError
 import uuid
-import re
 
 
 ad_routes_blueprint = Blueprint('ads', __name__)
 
+BUDGET_LEVELS = {'low': 1, 'medium': 2, 'high': 3}
+VALID_BUDGETS = frozenset(BUDGET_LEVELS)
+VALID_EVENT_TYPES = frozenset({'view', 'click', 'skip', 'exit'})
+AD_DETAIL_FIELDS = ('videoUrl', 'targetUrl', 'budget', 'skipTime', 'exitTime')
+
+# Documents per cursor batch when streaming list endpoints
+LIST_BATCH_SIZE = 200
+
+# Server-side time limit for reads on request hot paths
+QUERY_MAX_TIME_MS = 5000
+
 db = MongoConnectionManager.get_db()
 ads_collection = db['ads']
 performers_collection = db['performers']
 daily_stats_collection = db['daily_ad_stats']
 events_by_day_collection = db['events_by_day']
 developers_collection = db['developers']
+event_flushes_collection = db['event_flushes']
 
 try:
     # Index for performer stats queries
@@ -28,10 +47,87 @@ try:
         [("adId", 1), ("date", 1)],
         name="ad_date_idx"
     )
+
+    # Multikey index for finding the days that reference an ad
+    events_by_day_collection.create_index(
+        [("events.adId", 1)],
+        name="events_adId_idx"
+    )
+
+    # Ids of committed event batches, only needed while a batch may still
+    # be retried
+    event_flushes_collection.create_index(
+        [("createdAt", 1)],
+        expireAfterSeconds=86400,
+        name="event_flushes_ttl_idx"
+    )
 except Exception as e:
     print(f"[Init] Index creation failed: {e}")
 
+try:
+    # Unique email indexes for login/create lookups; kept separate so
+    # existing duplicate emails cannot block the stats indexes above
+    performers_collection.create_index(
+        [("email", 1)],
+        unique=True,
+        name="performer_email_uniq"
+    )
+    developers_collection.create_index(
+        [("email", 1)],
+        unique=True,
+        name="developer_email_uniq"
+    )
+except Exception as e:
+    print(f"[Init] Email index creation failed: {e}")
+
 # Helper functions
+def json_response(data, status=200):
+    """Serialize data with orjson and wrap it in a JSON response"""
+    return Response(orjson.dumps(data), status=status, mimetype='application/json')
+
+def stream_json_array(cursor):
+    """
+      Stream a cursor as a JSON array response without materializing it
+      
+      The first document is fetched eagerly so query errors are raised in
+      the caller, before the response has started.
+      
+      Args:
+          cursor (Cursor): MongoDB cursor to serialize
+          
+      Returns:
+          Response: Streaming application/json response
+      """
+    first = next(cursor, None)
+
+    def generate():
+        if first is None:
+            yield b'[]'
+            return
+        yield b'[' + orjson.dumps(first)
+        for doc in cursor:
+            yield b',' + orjson.dumps(doc)
+        yield b']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def parse_pagination(args):
+    """
+      Read the optional limit/skip query parameters
+      Args:
+          args (MultiDict): Request query arguments
+      Returns:
+          tuple: (limit, skip) as non-negative ints, or None if invalid
+      """
+    try:
+        limit = int(args.get('limit', 0))
+        skip = int(args.get('skip', 0))
+    except (ValueError, TypeError):
+        return None
+    if limit < 0 or skip < 0:
+        return None
+    return limit, skip
+
 def apply_date_filter(match_dict, args):
     """Apply date filtering based on query parameters"""
     date_from = args.get('from')
@@ -44,18 +140,67 @@ def apply_date_filter(match_dict, args):
         if date_to:
             match_dict['date']['$lte'] = date_to
 
-def build_stats_pipeline(match_criteria):
-    """Build a standard stats aggregation pipeline"""
-    return [
-        {'$match': match_criteria},
+# Shared stages for stats pipelines; only the $match varies per request
+STATS_PROJECT_STAGE = {'$project': {'_id': 0, 'adId': 1, 'counts': 1, 'watchDurationSum': 1}}
+
+STATS_GROUP_STAGE = {'$group': {
+    '_id': '$adId',
+    'views': {'$sum': '$counts.view'},
+    'clicks': {'$sum': '$counts.click'},
+    'skips': {'$sum': '$counts.skip'},
+    'exits': {'$sum': '$counts.exit'},
+    'watchDurationSum': {'$sum': '$watchDurationSum'}
+}}
+
+def build_stats_pipeline(match_criteria, ad_ids=None):
+    """Build a standard stats aggregation pipeline, optionally limited to ad_ids"""
+    if ad_ids is not None:
+        match_criteria['adId'] = {'$in': ad_ids}
+    return [{'$match': match_criteria}, STATS_PROJECT_STAGE, STATS_GROUP_STAGE]
+
+def build_performer_stats_pipeline(match_criteria, performer_id, ad_ids):
+    """
+      Build a stats pipeline that returns one row per performer ad
+      
+      Ads without any stats are zero-filled server-side by unioning in the
+      performer's ads array, and rows keep the order of that array.
+      
+      Args:
+          match_criteria (dict): Base $match criteria (performerId, date range)
+          performer_id (str): The performer ID
+          ad_ids (list): The performer's ad IDs
+          
+      Returns:
+          list: Aggregation pipeline for daily_stats_collection
+      """
+    zero = {'$literal': 0}
+    return build_stats_pipeline(match_criteria, ad_ids) + [
+        {'$unionWith': {
+            'coll': performers_collection.name,
+            'pipeline': [
+                {'$match': {'_id': performer_id}},
+                {'$unwind': {'path': '$ads', 'includeArrayIndex': 'position'}},
+                {'$project': {
+                    '_id': '$ads',
+                    'position': 1,
+                    'views': zero,
+                    'clicks': zero,
+                    'skips': zero,
+                    'exits': zero,
+                    'watchDurationSum': zero
+                }}
+            ]
+        }},
         {'$group': {
-            '_id': '$adId',
-            'views': {'$sum': '$counts.view'},
-            'clicks': {'$sum': '$counts.click'},
-            'skips': {'$sum': '$counts.skip'},
-            'exits': {'$sum': '$counts.exit'},
+            '_id': '$_id',
+            'position': {'$min': '$position'},
+            'views': {'$sum': '$views'},
+            'clicks': {'$sum': '$clicks'},
+            'skips': {'$sum': '$skips'},
+            'exits': {'$sum': '$exits'},
             'watchDurationSum': {'$sum': '$watchDurationSum'}
-        }}
+        }},
+        {'$sort': {'position': 1}}
     ]
 
 def validate_email_format(email):
@@ -72,9 +217,22 @@ def validate_email_format(email):
     email = email.strip()
     if not email:
         return False
-    
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_regex, email))
+
+    # Cheap structural checks before running the full validator
+    if len(email) < 5 or len(email) > 254 or not email.isascii() or email.count('@') != 1:
+        return False
+
+    local, domain = email.split('@')
+    if not local or len(local) > 64:
+        return False
+    if '.' not in domain or domain.startswith('.') or domain.endswith('.'):
+        return False
+
+    try:
+        validate_email(email, check_deliverability=False)
+    except EmailNotValidError:
+        return False
+    return True
 
 def calculate_ad_stats(stats_data, budget=None):
     """
@@ -90,6 +248,7 @@ def calculate_ad_stats(stats_data, budget=None):
     views = stats_data.get('views', 0)
     clicks = stats_data.get('clicks', 0)
     skips = stats_data.get('skips', 0)
+    exits = stats_data.get('exits', 0)
     watch_sum = stats_data.get('watchDurationSum', 0)
     
     # Calculate derived metrics
@@ -100,19 +259,257 @@ def calculate_ad_stats(stats_data, budget=None):
         "views": views,
         "clicks": clicks,
         "skips": skips,
+        "exits": exits,
         "avgWatchDuration": round(avg_watch, 2),
         "clickThroughRate": round(ctr, 2)
     }
     
     # Add conversion rate if budget is provided
     if budget:
-        BUDGET_LEVELS = {'low': 1, 'medium': 2, 'high': 3}
         budget_level = budget.strip().lower() if isinstance(budget, str) else ''
         conv_rate = (clicks / BUDGET_LEVELS.get(budget_level, 1) * 100) if views else 0
         stats["conversionRate"] = round(conv_rate, 2)
     
     return stats
 
+# Ad ownership cache (ad_id -> projected ad document); misses are not cached.
+# The TTL bounds staleness for workers that did not handle the update/delete.
+AD_OWNER_CACHE_TTL = 10  # seconds
+ad_owner_cache = TTLCache(maxsize=10_000, ttl=AD_OWNER_CACHE_TTL)
+ad_owner_cache_lock = threading.Lock()
+
+def get_ad_owner(ad_id):
+    """
+      Look up the ad's performerId, cached per ad_id
+      
+      Args:
+          ad_id (str): The ad ID
+          
+      Returns:
+          dict: {'performerId': ...} for the ad, or None if not found
+      """
+    with ad_owner_cache_lock:
+        ad_doc = ad_owner_cache.get(ad_id)
+    if ad_doc is None:
+        ad_doc = ads_collection.find_one(
+            {'_id': ad_id},
+            projection={'performerId': 1, '_id': 0},
+            max_time_ms=QUERY_MAX_TIME_MS
+        )
+        if ad_doc is not None:
+            with ad_owner_cache_lock:
+                ad_owner_cache[ad_id] = ad_doc
+    return ad_doc
+
+def forget_ad_owner(ad_id):
+    """Drop a cached ad ownership entry after the ad changes"""
+    with ad_owner_cache_lock:
+        ad_owner_cache.pop(ad_id, None)
+
+# Event buffering; opt-in because it needs a long-lived process; serverless
+# platforms such as Vercel freeze the instance between requests, so there
+# events are written synchronously instead
+EVENT_BUFFERING = os.getenv("EVENT_BUFFERING", "").lower() in ("1", "true", "yes")
+EVENT_FLUSH_INTERVAL = 0.1  # seconds between flushes
+EVENT_FLUSH_BATCH_SIZE = 500
+EVENT_QUEUE_MAX_SIZE = 10_000
+EVENT_RETRY_MAX_DELAY = 30  # seconds, cap for the retry backoff
+EVENT_MAX_ATTEMPTS = 8  # per batch, about 25s of backoff in total
+
+# Pending (date, event document) pairs, bounded so a stalled database
+# cannot grow memory without limit
+event_queue = Queue(maxsize=EVENT_QUEUE_MAX_SIZE)
+event_flusher_stop = threading.Event()
+
+def take_event_batch():
+    """Pop up to one batch of queued events without blocking"""
+    batch = []
+    try:
+        while len(batch) < EVENT_FLUSH_BATCH_SIZE:
+            batch.append(event_queue.get_nowait())
+    except Empty:
+        pass
+    return batch
+
+def write_event(date, event):
+    """
+      Write a single event straight to MongoDB, used when EVENT_BUFFERING
+      is unset
+      
+      Plain upserts without a session, so concurrent requests for the same
+      day or ad do not contend on transaction write conflicts.
+      
+      Args:
+          date (str): Event date (YYYY-MM-DD)
+          event (dict): Event document
+      """
+    ad_id = event['adId']
+    event_type = event['eventType']
+    watch_duration = event['watchDuration']
+
+    events_by_day_collection.update_one(
+        {"date": date},
+        {"$push": {"events": event},
+         "$setOnInsert": {"createdAt": event['createdAt']}},
+        upsert=True
+    )
+
+    daily_stats_collection.update_one(
+        {"performerId": event['performerId'], "adId": ad_id, "date": date},
+        {"$inc": {f"counts.{event_type}": 1, "watchDurationSum": watch_duration},
+         "$setOnInsert": {"adId": ad_id, "createdAt": event['createdAt']}},
+        upsert=True
+    )
+
+    # Lifetime counters on the ad itself, as in write_event_batch
+    ads_collection.update_one(
+        {"_id": ad_id, "stats": {"$exists": True}},
+        {"$inc": {f"stats.{event_type}s": 1, "stats.watchDurationSum": watch_duration}}
+    )
+
+def write_event_batch(batch_id, batch):
+    """
+      Write a batch of events to MongoDB in a single transaction
+      
+      Events are grouped per day for events_by_day, per
+      (performerId, adId, date) for daily_ad_stats and per ad for the
+      ad's lifetime stats, so each key costs a single UpdateOne no matter
+      how many events it received. All three stores commit together, so a
+      failure leaves none of them updated, and the batch id is recorded in
+      event_flushes so writing the same batch again is a no-op. Events for
+      ads deleted since they were accepted are dropped, so they cannot
+      recreate the stats delete_ad removed.
+      
+      Args:
+          batch_id (str): Stable id of the batch across retries
+          batch (list): (date, event document) pairs
+      """
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    batch_ad_ids = list({event['adId'] for _, event in batch})
+
+    def apply(session):
+        if event_flushes_collection.find_one({'_id': batch_id}, {'_id': 1}, session=session):
+            return  # committed by an earlier attempt
+
+        live_ad_ids = {
+            doc['_id']
+            for doc in ads_collection.find({'_id': {'$in': batch_ad_ids}}, {'_id': 1}, session=session)
+        }
+
+        events_by_date = defaultdict(list)
+        stats_by_key = defaultdict(lambda: defaultdict(int))
+        totals_by_ad = defaultdict(lambda: defaultdict(int))
+        for date, event in batch:
+            if event['adId'] not in live_ad_ids:
+                continue
+            events_by_date[date].append(event)
+
+            inc_fields = stats_by_key[(event['performerId'], event['adId'], date)]
+            inc_fields[f"counts.{event['eventType']}"] += 1
+            inc_fields['watchDurationSum'] += event['watchDuration']
+
+            ad_totals = totals_by_ad[event['adId']]
+            ad_totals[f"stats.{event['eventType']}s"] += 1
+            ad_totals['stats.watchDurationSum'] += event['watchDuration']
+
+        if not events_by_date:
+            return
+
+        events_by_day_collection.bulk_write([
+            UpdateOne(
+                {"date": date},
+                {"$push": {"events": {"$each": events}},
+                 "$setOnInsert": {"createdAt": now_iso}},
+                upsert=True
+            )
+            for date, events in events_by_date.items()
+        ], ordered=False, session=session)
+
+        daily_stats_collection.bulk_write([
+            UpdateOne(
+                {"performerId": performer_id, "adId": ad_id, "date": date},
+                {"$inc": dict(inc_fields),
+                 "$setOnInsert": {"adId": ad_id, "createdAt": now_iso}},
+                upsert=True
+            )
+            for (performer_id, ad_id, date), inc_fields in stats_by_key.items()
+        ], ordered=False, session=session)
+
+        # Lifetime counters on the ad itself; ads created before the counters
+        # existed have no stats field and keep using daily_ad_stats
+        ads_collection.bulk_write([
+            UpdateOne(
+                {"_id": ad_id, "stats": {"$exists": True}},
+                {"$inc": dict(ad_totals)}
+            )
+            for ad_id, ad_totals in totals_by_ad.items()
+        ], ordered=False, session=session)
+
+        event_flushes_collection.insert_one({'_id': batch_id, 'createdAt': now}, session=session)
+
+    with db.client.start_session() as session:
+        session.with_transaction(apply)
+
+def is_transient_write_error(error):
+    """Whether a failed batch write may succeed if tried again"""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, PyMongoError) and (
+        error.has_error_label('TransientTransactionError')
+        or error.has_error_label('UnknownTransactionCommitResult')
+    )
+
+def run_event_flusher():
+    """
+      Background loop that drains the event queue until asked to stop
+      
+      A batch that fails with a transient error stays pending and is
+      retried, with exponential backoff, before any newer events are
+      taken; meanwhile the queue fills up and send_ad_event answers 503.
+      Batches that fail otherwise, or EVENT_MAX_ATTEMPTS times, are
+      logged and dropped so one bad batch cannot stall the flusher.
+      """
+    pending = None  # (batch_id, batch) not yet committed
+    attempts = 0
+    delay = EVENT_FLUSH_INTERVAL
+    stopping = False
+    while not stopping:
+        stopping = event_flusher_stop.wait(delay)
+        try:
+            while True:
+                if pending is None:
+                    batch = take_event_batch()
+                    if not batch:
+                        break
+                    pending = (str(uuid.uuid4()), batch)
+                    attempts = 0
+                attempts += 1
+                write_event_batch(*pending)
+                pending = None
+            delay = EVENT_FLUSH_INTERVAL
+        except Exception as e:
+            if is_transient_write_error(e) and attempts < EVENT_MAX_ATTEMPTS:
+                delay = min(delay * 2, EVENT_RETRY_MAX_DELAY)
+                print(f"[EventFlusher] Flush failed, retrying in {delay:.1f}s: {e}")
+            else:
+                print(f"[EventFlusher] Dropping {len(pending[1])} events after {attempts} attempts: {e}")
+                pending = None
+                delay = EVENT_FLUSH_INTERVAL
+
+    if pending is not None:
+        print(f"[EventFlusher] Dropping {len(pending[1])} events on shutdown")
+
+def stop_event_flusher():
+    """Stop the flusher thread after a final drain of queued events"""
+    event_flusher_stop.set()
+    event_flusher_thread.join(timeout=5)
+
+if EVENT_BUFFERING:
+    event_flusher_thread = threading.Thread(target=run_event_flusher, name='event-flusher', daemon=True)
+    event_flusher_thread.start()
+    atexit.register(stop_event_flusher)
+
 # Create new performer
 @ad_routes_blueprint.route('/performers', methods=['POST'])
 def create_performer():
@@ -140,38 +537,48 @@ def create_performer():
           description: Invalid input or email format
       """
   
-    data = request.json
-    required_fields = ['name', 'email']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing name or email'}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
+
+    if 'name' not in data or 'email' not in data:
+        return json_response({'error': 'Missing name or email'}, 400)
 
     name = data['name'].strip()
     email = data['email'].strip()
     if not name or not email:
-        return jsonify({'error': 'Name and email cannot be empty'}), 400
+        return json_response({'error': 'Name and email cannot be empty'}, 400)
     
     if not validate_email_format(email):
-        return jsonify({'error': 'Invalid email format'}), 400
-
-    existing = performers_collection.find_one({'email': email})
-    if existing:
-        return jsonify({
-            'message': 'Performer already exists',
-            'performerId': existing['_id']
-        }), 200
-
-    performer = {
-        "_id": str(uuid.uuid4()),
-        "name": name,
-        "email": email,
-        "ads": []
-    }
+        return json_response({'error': 'Invalid email format'}, 400)
 
+    # Insert-or-fetch in a single round-trip; the email comes from the filter
+    performer_id = str(uuid.uuid4())
     try:
-        performers_collection.insert_one(performer)
-        return jsonify({'message': 'Performer created', 'performerId': performer['_id']}), 201
+        performer = performers_collection.find_one_and_update(
+            {'email': email},
+            {'$setOnInsert': {
+                "_id": performer_id,
+                "name": name,
+                "ads": []
+            }},
+            projection={'_id': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted the same email first
+        performer = performers_collection.find_one({'email': email}, projection={'_id': 1})
     except Exception as e:
-        return jsonify({'error': f'Failed to create performer: {str(e)}'}), 500
+        return json_response({'error': f'Failed to create performer: {str(e)}'}, 500)
+
+    if performer['_id'] != performer_id:
+        return json_response({
+            'message': 'Performer already exists',
+            'performerId': performer['_id']
+        })
+
+    return json_response({'message': 'Performer created', 'performerId': performer_id}, 201)
 
 # Check if performer exists by email
 @ad_routes_blueprint.route('/performers/check-email', methods=['POST'])
@@ -195,21 +602,26 @@ def check_performer_email():
         400:
           description: Missing or invalid email format
       """
-    data = request.json
-    if 'email' not in data or not data['email'].strip():
-        return jsonify({'error': 'Missing or empty email'}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
+
+    if 'email' not in data:
+        return json_response({'error': 'Missing or empty email'}, 400)
     
     email = data['email'].strip()
+    if not email:
+        return json_response({'error': 'Missing or empty email'}, 400)
     
     if not validate_email_format(email):
-      return jsonify({'error': 'Invalid email format'}), 400
+      return json_response({'error': 'Invalid email format'}, 400)
 
     # Check if email exists
     existing = performers_collection.find_one({'email': email})
     if existing:
-        return jsonify({'exists': True, 'performerId': existing['_id']}), 200
+        return json_response({'exists': True, 'performerId': existing['_id']})
     else:
-        return jsonify({'exists': False}), 200
+        return json_response({'exists': False})
 
 # Get all performers (for developer view)
 @ad_routes_blueprint.route('/performers', methods=['GET'])
@@ -219,19 +631,46 @@ def get_all_performers():
       ---
       tags:
         - Performers
+      parameters:
+        - name: limit
+          in: query
+          type: integer
+          required: false
+          description: Maximum number of performers to return (0 = no limit)
+        - name: skip
+          in: query
+          type: integer
+          required: false
+          description: Number of performers to skip
+        - name: includeAds
+          in: query
+          type: boolean
+          required: false
+          description: Include each performer's list of ad IDs
       responses:
         200:
           description: List of all performers
+        400:
+          description: Invalid pagination parameters
         500:
           description: Server error while retrieving performers
       """
+    pagination = parse_pagination(request.args)
+    if pagination is None:
+        return json_response({'error': 'Invalid limit or skip'}, 400)
+    limit, skip = pagination
+
+    include_ads = request.args.get('includeAds', '').strip().lower() == 'true'
+    projection = None if include_ads else {'ads': 0}
+
     try:
-        performers = list(performers_collection.find())
-        for performer in performers:
-            performer['_id'] = str(performer['_id'])
-        return jsonify(performers), 200
+        # _id is already a UUID string, so documents serialize as-is
+        cursor = performers_collection.find(
+            {}, projection=projection, sort=[('_id', 1)], skip=skip, limit=limit
+        ).batch_size(LIST_BATCH_SIZE).max_time_ms(QUERY_MAX_TIME_MS)
+        return stream_json_array(cursor)
     except Exception:
-        return jsonify({'error': 'Failed to retrieve performers'}), 500
+        return json_response({'error': 'Failed to retrieve performers'}, 500)
 
 # Login developer
 @ad_routes_blueprint.route('/developers/login', methods=['POST'])
@@ -258,24 +697,27 @@ def developer_login():
           description: Missing or invalid email
       """
  
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
+
     if 'email' not in data:
-        return jsonify({'error': 'Missing email'}), 400
+        return json_response({'error': 'Missing email'}, 400)
     
     email = data['email'].strip()
 
     if not validate_email_format(email):
-      return jsonify({'error': 'Invalid email format'}), 400
+      return json_response({'error': 'Invalid email format'}, 400)
     
     # Check if developer exists
     developer = developers_collection.find_one({'email': email})
     if developer:
-        return jsonify({
+        return json_response({
             'exists': True, 
             'developerId': developer['_id']
-        }), 200
+        })
     else:
-        return jsonify({'exists': False}), 404
+        return json_response({'exists': False}, 404)
 
 # Create a developer
 @ad_routes_blueprint.route('/developers', methods=['POST'])
@@ -304,39 +746,48 @@ def create_developer():
           description: Invalid input or email format
       """
  
-    data = request.json
-    required_fields = ['name', 'email']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing name or email'}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
+
+    if 'name' not in data or 'email' not in data:
+        return json_response({'error': 'Missing name or email'}, 400)
 
     name = data['name'].strip()
     email = data['email'].strip()
     if not name or not email:
-        return jsonify({'error': 'Name and email cannot be empty'}), 400
+        return json_response({'error': 'Name and email cannot be empty'}, 400)
     
     if not validate_email_format(email):
-        return jsonify({'error': 'Invalid email format'}), 400
-
-    # Check if email exists
-    existing = developers_collection.find_one({'email': email})
-    if existing:
-        return jsonify({
-            'message': 'Developer already exists',
-            'developerId': existing['_id']
-        }), 200
-
-    developer = {
-        "_id": str(uuid.uuid4()),
-        "name": name,
-        "email": email,
-        "createdAt": datetime.now(timezone.utc).isoformat()
-    }
+        return json_response({'error': 'Invalid email format'}, 400)
 
+    # Insert-or-fetch in a single round-trip; the email comes from the filter
+    developer_id = str(uuid.uuid4())
     try:
-        developers_collection.insert_one(developer)
-        return jsonify({'message': 'Developer created', 'developerId': developer['_id']}), 201
+        developer = developers_collection.find_one_and_update(
+            {'email': email},
+            {'$setOnInsert': {
+                "_id": developer_id,
+                "name": name,
+                "createdAt": datetime.now(timezone.utc).isoformat()
+            }},
+            projection={'_id': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted the same email first
+        developer = developers_collection.find_one({'email': email}, projection={'_id': 1})
     except Exception as e:
-        return jsonify({'error': f'Failed to create developer: {str(e)}'}), 500
+        return json_response({'error': f'Failed to create developer: {str(e)}'}, 500)
+
+    if developer['_id'] != developer_id:
+        return json_response({
+            'message': 'Developer already exists',
+            'developerId': developer['_id']
+        })
+
+    return json_response({'message': 'Developer created', 'developerId': developer_id}, 201)
 
 # Create new ad
 @ad_routes_blueprint.route('/ads', methods=['POST'])
@@ -379,25 +830,25 @@ def create_ad():
           description: Performer not found
       """
  
-    ad_data = request.json
+    ad_data = request.get_json(silent=True)
+    if not isinstance(ad_data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
 
-    required_fields = ['adName', 'performerEmail', 'adDetails']
-    if not all(field in ad_data for field in required_fields):
-        return jsonify({'error': 'Missing required fields (adName, performerEmail, adDetails)'}), 400
+    if 'adName' not in ad_data or 'performerEmail' not in ad_data or 'adDetails' not in ad_data:
+        return json_response({'error': 'Missing required fields (adName, performerEmail, adDetails)'}, 400)
 
     performer_email = ad_data['performerEmail'].strip()
     performer = performers_collection.find_one({'email': performer_email})
     if not performer:
-        return jsonify({'error': 'Performer not found'}), 404
+        return json_response({'error': 'Performer not found'}, 404)
 
     performer_id = performer['_id']
     name = ad_data['adName']
     ad_details = ad_data['adDetails']
 
     # Validation for adDetails
-    required_details = ['videoUrl', 'targetUrl', 'budget', 'skipTime', 'exitTime']
-    if not all(field in ad_details for field in required_details):
-        return jsonify({'error': 'Missing adDetails fields'}), 400
+    if not all(field in ad_details for field in AD_DETAIL_FIELDS):
+        return json_response({'error': 'Missing adDetails fields'}, 400)
 
     video_url = ad_details['videoUrl'].strip()
     target_url = ad_details['targetUrl'].strip()
@@ -406,13 +857,14 @@ def create_ad():
         skip_time = float(ad_details['skipTime'])
         exit_time = float(ad_details['exitTime'])
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid skipTime or exitTime'}), 400
+        return json_response({'error': 'Invalid skipTime or exitTime'}, 400)
 
     if not video_url.startswith("http") or not target_url.startswith("http"):
-        return jsonify({'error': 'Invalid URLs'}), 400
-    if budget not in {"low", "medium", "high"}:
-        return jsonify({'error': 'Invalid budget'}), 400
+        return json_response({'error': 'Invalid URLs'}, 400)
+    if budget not in VALID_BUDGETS:
+        return json_response({'error': 'Invalid budget'}, 400)
 
+    now_iso = datetime.now(timezone.utc).isoformat()
     ad = {
         "_id": str(uuid.uuid4()),
         "name": name.strip(),
@@ -425,8 +877,15 @@ def create_ad():
             "skipTime": skip_time,
             "exitTime": exit_time
         },
-        "createdAt": datetime.now(timezone.utc).isoformat(),
-        "updatedAt": datetime.now(timezone.utc).isoformat()
+        "stats": {
+            "views": 0,
+            "clicks": 0,
+            "skips": 0,
+            "exits": 0,
+            "watchDurationSum": 0
+        },
+        "createdAt": now_iso,
+        "updatedAt": now_iso
     }
 
     try:
@@ -435,9 +894,9 @@ def create_ad():
             {'_id': performer_id},
             {'$addToSet': {'ads': ad['_id']}}
         )
-        return jsonify({'message': 'Ad created successfully', 'adId': ad['_id']}), 201
+        return json_response({'message': 'Ad created successfully', 'adId': ad['_id']}, 201)
     except Exception:
-        return jsonify({'error': 'Failed to create ad'}), 500
+        return json_response({'error': 'Failed to create ad'}, 500)
 
 # Get all ads
 @ad_routes_blueprint.route('/ads', methods=['GET'])
@@ -447,20 +906,38 @@ def get_all_ads():
       ---
       tags:
         - Ads
+      parameters:
+        - name: limit
+          in: query
+          type: integer
+          required: false
+          description: Maximum number of ads to return (0 = no limit)
+        - name: skip
+          in: query
+          type: integer
+          required: false
+          description: Number of ads to skip
       responses:
         200:
-          description: List of all ads
+          description: List of all ads (without videoUrl)
+        400:
+          description: Invalid pagination parameters
         500:
           description: Server error while retrieving ads
       """
- 
+    pagination = parse_pagination(request.args)
+    if pagination is None:
+        return json_response({'error': 'Invalid limit or skip'}, 400)
+    limit, skip = pagination
+
     try:
-        ads = list(ads_collection.find())
-        for ad in ads:
-            ad['_id'] = str(ad['_id'])
-        return jsonify(ads), 200
+        # _id is already a UUID string, so documents serialize as-is
+        cursor = ads_collection.find(
+            {}, projection={'adDetails.videoUrl': 0, 'stats': 0}, sort=[('_id', 1)], skip=skip, limit=limit
+        ).batch_size(LIST_BATCH_SIZE).max_time_ms(QUERY_MAX_TIME_MS)
+        return stream_json_array(cursor)
     except Exception:
-        return jsonify({'error': 'Failed to retrieve ads'}), 500
+        return json_response({'error': 'Failed to retrieve ads'}, 500)
 
 # Get one ad by id
 @ad_routes_blueprint.route('/ads/<ad_id>', methods=['GET'])
@@ -485,11 +962,10 @@ def get_ad_by_id(ad_id):
     try:
         ad = ads_collection.find_one({'_id': ad_id})
         if ad:
-            ad['_id'] = str(ad['_id'])
-            return jsonify(ad), 200
-        return jsonify({'error': 'Ad not found'}), 404
+            return json_response(ad)
+        return json_response({'error': 'Ad not found'}, 404)
     except Exception:
-        return jsonify({'error': 'Failed to retrieve ad'}), 500
+        return json_response({'error': 'Failed to retrieve ad'}, 500)
 
 # Update ad
 @ad_routes_blueprint.route('/ads/<ad_id>', methods=['PUT'])
@@ -518,19 +994,24 @@ def update_ad(ad_id):
           description: Invalid update data
       """
 
-    update_data = request.json
+    update_data = request.get_json(silent=True)
     if not isinstance(update_data, dict):
-        return jsonify({'error': 'Invalid update data'}), 400
+        return json_response({'error': 'Invalid update data'}, 400)
+
+    # Lifetime stats are maintained by the event flusher only
+    if any(key == 'stats' or key.startswith('stats.') for key in update_data):
+        return json_response({'error': 'stats cannot be updated'}, 400)
 
     update_data['updatedAt'] = datetime.now(timezone.utc).isoformat()
 
     try:
         result = ads_collection.update_one({'_id': ad_id}, {'$set': update_data})
+        forget_ad_owner(ad_id)
         if result.matched_count:
-            return jsonify({'message': 'Ad updated'}), 200
-        return jsonify({'error': 'Ad not found'}), 404
+            return json_response({'message': 'Ad updated'})
+        return json_response({'error': 'Ad not found'}, 404)
     except Exception:
-        return jsonify({'error': 'Failed to update ad'}), 500
+        return json_response({'error': 'Failed to update ad'}, 500)
 
 # Delete ad
 @ad_routes_blueprint.route('/ads/<ad_id>', methods=['DELETE'])
@@ -553,35 +1034,32 @@ def delete_ad(ad_id):
       """
   
     try:
-        # 1. First find the ad to get performer ID
-        ad = ads_collection.find_one({'_id': ad_id})
+        # 1. Delete the ad and get its performer ID in one round-trip
+        ad = ads_collection.find_one_and_delete({'_id': ad_id}, projection={'performerId': 1})
         if not ad:
-            return jsonify({'error': 'Ad not found'}), 404
+            return json_response({'error': 'Ad not found'}, 404)
             
         performer_id = ad.get('performerId')
+        forget_ad_owner(ad_id)
         
-        # 2. Delete ad from ads collection
-        ads_collection.delete_one({'_id': ad_id})
-        
-        # 3. Remove ad from performer's ads array
+        # 2. Remove ad from performer's ads array
         performers_collection.update_one(
             {'_id': performer_id},
             {'$pull': {'ads': ad_id}}
         )
         
-        # 4. Clean up events that reference this ad
-        # (Optional) Filter by date for performance on large collections
+        # 3. Clean up events that reference this ad (only days that contain it)
         events_by_day_collection.update_many(
-            {},
+            {'events.adId': ad_id},
             {'$pull': {'events': {'adId': ad_id}}}
         )
         
-        # 5. Remove statistics for this ad
+        # 4. Remove statistics for this ad
         daily_stats_collection.delete_many({'adId': ad_id})
         
-        return jsonify({'message': 'Ad and related data deleted successfully'}), 200
+        return json_response({'message': 'Ad and related data deleted successfully'})
     except Exception as e:
-        return jsonify({'error': f'Failed to delete ad: {str(e)}'}), 500
+        return json_response({'error': f'Failed to delete ad: {str(e)}'}, 500)
         
 # Get random ad for app
 @ad_routes_blueprint.route('/ads/random', methods=['GET'])
@@ -606,22 +1084,25 @@ def get_random_ad():
       """
  
     package_name = request.args.get('packageName')
-    if not isinstance(package_name, str) or not package_name.strip():
-        return jsonify({'error': 'Missing or invalid packageName'}), 400
-    package_name = package_name.strip() 
+    package_name = package_name.strip() if isinstance(package_name, str) else ''
+    if not package_name:
+        return json_response({'error': 'Missing or invalid packageName'}, 400)
 
     try:
-        all_ads = list(ads_collection.find())
-        
-        if not all_ads:
-            return jsonify({'message': 'No ads available'}), 204
+        # Let MongoDB pick the ad instead of loading every ad into memory
+        cursor = ads_collection.aggregate(
+            [{'$sample': {'size': 1}}, {'$project': {'stats': 0}}],
+            maxTimeMS=QUERY_MAX_TIME_MS
+        )
+        chosen_ad = next(cursor, None)
 
-        chosen_ad = random.choice(all_ads)
-        chosen_ad['_id'] = str(chosen_ad['_id'])
-        return jsonify(chosen_ad), 200
+        if chosen_ad is None:
+            return json_response({'message': 'No ads available'}, 204)
+
+        return json_response(chosen_ad)
 
     except Exception as e:
-        return jsonify({'error': f'Failed to retrieve random ad: {str(e)}'}), 500
+        return json_response({'error': f'Failed to retrieve random ad: {str(e)}'}, 500)
 
 # Send ad event
 @ad_routes_blueprint.route('/ad_event', methods=['POST'])
@@ -654,26 +1135,35 @@ def send_ad_event():
       responses:
         201:
           description: Event logged successfully
+        202:
+          description: Event accepted for logging (EVENT_BUFFERING enabled)
         400:
           description: Invalid event data
         404:
           description: Ad not found
+        500:
+          description: Failed to store event
+        503:
+          description: Event queue is full
       """
 
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({'error': 'Invalid JSON body'}, 400)
+
     if 'adId' not in data or 'timestamp' not in data or 'eventDetails' not in data:
-        return jsonify({'error': 'Missing adId, timestamp or eventDetails'}), 400
+        return json_response({'error': 'Missing adId, timestamp or eventDetails'}, 400)
 
     ad_id = data['adId']
     timestamp = data['timestamp']
     event_details = data['eventDetails']
 
     if not isinstance(ad_id, str) or not ad_id.strip():
-        return jsonify({'error': 'Invalid adId format'}), 400
+        return json_response({'error': 'Invalid adId format'}, 400)
 
-    required_fields = ['packageName', 'eventType', 'watchDuration']
-    if not all(field in event_details for field in required_fields):
-        return jsonify({'error': 'Missing eventDetails fields'}), 400
+    if ('packageName' not in event_details or 'eventType' not in event_details
+            or 'watchDuration' not in event_details):
+        return json_response({'error': 'Missing eventDetails fields'}, 400)
 
     package_name = event_details['packageName'].strip()
     event_type = event_details['eventType'].strip().lower()
@@ -685,77 +1175,56 @@ def send_ad_event():
         'timestamp': timestamp
     }.items():
         if not isinstance(value, str) or not value:
-            return jsonify({'error': f'Invalid or empty field: {field_name}'}), 400
+            return json_response({'error': f'Invalid or empty field: {field_name}'}, 400)
 
-    VALID_TYPES = {'view', 'click', 'skip', 'exit'}
-    if event_type not in VALID_TYPES:
-        return jsonify({'error': 'Invalid eventType'}), 400
+    if event_type not in VALID_EVENT_TYPES:
+        return json_response({'error': 'Invalid eventType'}, 400)
 
     try:
         watch_duration = float(watch_duration)
         if watch_duration < 0:
-            return jsonify({'error': 'watchDuration must be non-negative'}), 400
+            return json_response({'error': 'watchDuration must be non-negative'}, 400)
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid watchDuration format'}), 400
+        return json_response({'error': 'Invalid watchDuration format'}, 400)
 
-    ad_doc = ads_collection.find_one({'_id': ad_id})
-    if not ad_doc:
-        return jsonify({'error': 'Ad not found'}), 404
+    ad_doc = get_ad_owner(ad_id)
+    if ad_doc is None:
+        return json_response({'error': 'Ad not found'}, 404)
 
     performer_id = ad_doc.get('performerId')
     if not performer_id:
-        return jsonify({'error': 'Ad has no performer assigned'}), 500
+        return json_response({'error': 'Ad has no performer assigned'}, 500)
+
+    # Get the current time; today's date is its YYYY-MM-DD prefix
+    now_iso = datetime.now(timezone.utc).isoformat()
+    today_date = now_iso[:10]
 
+    # Create the event document
+    event_document = {
+        "adId": ad_id,
+        "performerId": performer_id,
+        "packageName": package_name,
+        "timestamp": timestamp,
+        "eventType": event_type,
+        "watchDuration": watch_duration,
+        "createdAt": now_iso
+    }
+
+    if not EVENT_BUFFERING:
+        try:
+            write_event(today_date, event_document)
+        except Exception as e:
+            return json_response({'error': f'Failed to store event: {str(e)}'}, 500)
+        return json_response({'message': 'Event logged'}, 201)
+
+    # Queue for the background flusher, which batches the events_by_day
+    # and daily_ad_stats writes
     try:
-        # Get today's date
-        today_date = datetime.now(timezone.utc).date().isoformat()
-        
-        # Create the event document
-        event_document = {
-            "adId": ad_id,
-            "performerId": performer_id,
-            "packageName": package_name,
-            "timestamp": timestamp,
-            "eventType": event_type,
-            "watchDuration": watch_duration,
-            "createdAt": datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Store in events_by_day collection
-        events_by_day_collection.update_one(
-            {"date": today_date},
-            {"$push": {"events": event_document},
-             "$setOnInsert": {"createdAt": datetime.now(timezone.utc).isoformat()}},
-            upsert=True
-        )
-        
-        # Update daily performer stats
-        stats_key = {
-            "performerId": performer_id,
-            "adId": ad_id,
-            "date": today_date
-        }
-        
-        inc_fields = {f"counts.{event_type}": 1}
-        
-        inc_fields["watchDurationSum"] = watch_duration
-        
-        daily_stats_collection.update_one(
-            stats_key,
-            {
-                "$inc": inc_fields,
-                "$setOnInsert": {
-                    "adId": ad_id,
-                    "createdAt": datetime.now(timezone.utc).isoformat()
-                }
-            },
-            upsert=True
-        )
-        
-        return jsonify({'message': 'Event logged'}), 201
+        event_queue.put_nowait((today_date, event_document))
+    except Full:
+        return json_response({'error': 'Event queue is full, please retry'}, 503)
 
-    except Exception as e:
-        return jsonify({'error': f'Failed to store event: {str(e)}'}), 500
+    return json_response({'message': 'Event queued'}, 202)
 
 # Get ad statistics by id
 @ad_routes_blueprint.route('/ads/<ad_id>/stats', methods=['GET'])
@@ -787,28 +1256,33 @@ def get_ad_statistics(ad_id):
           description: Ad not found
       """
  
-    ad_doc = ads_collection.find_one({'_id': ad_id})
+    ad_doc = ads_collection.find_one({'_id': ad_id}, projection={'adDetails.budget': 1, 'stats': 1})
     if not ad_doc:
-        return jsonify({'error': 'Ad not found'}), 404
+        return json_response({'error': 'Ad not found'}, 404)
 
-    match = {'adId': ad_id}
-    apply_date_filter(match, request.args)
+    has_date_range = request.args.get('from') or request.args.get('to')
+    if not has_date_range and 'stats' in ad_doc:
+        # Lifetime totals are kept on the ad document, no aggregation needed
+        totals = ad_doc['stats']
+    else:
+        match = {'adId': ad_id}
+        apply_date_filter(match, request.args)
 
-    pipeline = build_stats_pipeline(match)
-    agg = list(daily_stats_collection.aggregate(pipeline))
-    
-    totals = agg[0] if agg else {
-        'views': 0, 'clicks': 0, 'skips': 0, 'exits': 0, 'watchDurationSum': 0
-    }
+        pipeline = build_stats_pipeline(match)
+        agg = list(daily_stats_collection.aggregate(pipeline, maxTimeMS=QUERY_MAX_TIME_MS))
+        
+        totals = agg[0] if agg else {
+            'views': 0, 'clicks': 0, 'skips': 0, 'exits': 0, 'watchDurationSum': 0
+        }
 
     budget = ad_doc.get('adDetails', {}).get('budget', '')
     stats = calculate_ad_stats(totals, budget)
 
-    return jsonify({
+    return json_response({
         'adId': ad_id,
         'dateRange': {'from': request.args.get('from'), 'to': request.args.get('to')},
         'adStats': stats
-    }), 200
+    })
 
 # Get ad statistics by performer
 @ad_routes_blueprint.route('/performers/<performer_id>/stats', methods=['GET'])
@@ -843,34 +1317,28 @@ def get_performer_statistics(performer_id):
     try:
         performer = performers_collection.find_one({'_id': performer_id})
         if not performer:
-            return jsonify({'error': 'Performer not found'}), 404
+            return json_response({'error': 'Performer not found'}, 404)
 
         ad_ids = performer.get('ads', [])
-        stats_list = []
+        if not ad_ids:
+            return json_response({"performerId": performer_id, "adsStats": []})
 
         match = {'performerId': performer_id}
         apply_date_filter(match, request.args)
 
-        # Use helper function to build the pipeline
-        pipeline = build_stats_pipeline(match)
-        ad_stats = {stat['_id']: stat for stat in daily_stats_collection.aggregate(pipeline) if stat['_id'] in ad_ids}
+        # One row per ad, zero-filled and ordered by the database
+        pipeline = build_performer_stats_pipeline(match, performer_id, ad_ids)
 
-        
-        for ad_id in ad_ids:
-            stats = ad_stats.get(ad_id, {
-                'views': 0, 'clicks': 0, 'skips': 0, 'exits': 0, 'watchDurationSum': 0
-            })
-            
+        stats_list = []
+        for stats in daily_stats_collection.aggregate(pipeline, maxTimeMS=QUERY_MAX_TIME_MS):
             ad_stats_result = calculate_ad_stats(stats)
-            ad_stats_result["adId"] = ad_id
-            ad_stats_result["exits"] = stats.get('exits', 0) 
+            ad_stats_result["adId"] = stats['_id']
             stats_list.append(ad_stats_result)
 
-
-        return jsonify({
+        return json_response({
             "performerId": performer_id,
             "adsStats": stats_list
-        }), 200
+        })
 
     except Exception as e:
-        return jsonify({'error': f'Failed to retrieve performer statistics: {str(e)}'}), 500
\ No newline at end of file
+        return json_response({'error': f'Failed to retrieve performer statistics: {str(e)}'}, 500)
\ No newline at end of file
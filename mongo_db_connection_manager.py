@@ -3,6 +3,7 @@ from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
 import os
+import threading
 
 
 load_dotenv()
@@ -12,10 +13,15 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USERNAME = os.getenv("DB_USERNAME")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# Pool sized per process: one connection per gunicorn thread plus headroom
+DB_MAX_POOL_SIZE = int(os.getenv("DB_MAX_POOL_SIZE", 20))
+DB_MIN_POOL_SIZE = int(os.getenv("DB_MIN_POOL_SIZE", 2))
+
 Mongo_URI = f"mongodb+srv://{DB_USERNAME}:{DB_PASSWORD}@{DB_CONNECTION_STRING}/{DB_NAME}"
 
 class MongoConnectionManager:
     __db = None
+    __lock = threading.Lock()
 
     @staticmethod
     def init_db():
@@ -26,16 +32,32 @@ class MongoConnectionManager:
         :rtype: Database
         """
         if MongoConnectionManager.__db is None:
+            # Only one thread may build the client, so each process gets a single pool
+            with MongoConnectionManager.__lock:
+                if MongoConnectionManager.__db is None:
 
-            # Create a new client and connect to the server
-            client = MongoClient(Mongo_URI, server_api=ServerApi('1'))
-            # Send a ping to confirm a successful connection
-            try:
-                client.admin.command('ping')
-                print("Pinged your deployment. You successfully connected to MongoDB!")
-                MongoConnectionManager.__db = client[DB_NAME]
-            except Exception as e:
-                print(e)
+                    # Create a new client and connect to the server
+                    client = MongoClient(
+                        Mongo_URI,
+                        server_api=ServerApi('1'),
+                        appname='ad-server',
+                        compressors='zstd,zlib',
+                        retryWrites=True,
+                        maxPoolSize=DB_MAX_POOL_SIZE,
+                        minPoolSize=DB_MIN_POOL_SIZE,
+                        maxIdleTimeMS=300_000,
+                        waitQueueTimeoutMS=2000,
+                        connectTimeoutMS=3000,
+                        serverSelectionTimeoutMS=3000
+                    )
+                    # Send a ping to confirm a successful connection
+                    try:
+                        client.admin.command('ping')
+                        print("Pinged your deployment. You successfully connected to MongoDB!")
+                        MongoConnectionManager.__db = client[DB_NAME]
+                    except Exception as e:
+                        client.close()
+                        print(e)
         return MongoConnectionManager.__db    
 
 